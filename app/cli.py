@@ -1,3 +1,4 @@
+import logging
 import sys
 from typing import Optional
 
@@ -35,29 +36,40 @@ def input_int(prompt: str, default: Optional[int] = None) -> Optional[int]:
     s = input_str(prompt)
     if s == "" and default is not None:
         return default
-    try:
-        return int(s)
-    except ValueError:
+    # проверка без исключений: isdecimal() принимает ровно те цифры, которые понимает int();
+    # длина ограничена, чтобы огромная строка цифр не упёрлась в лимит int() на число знаков
+    digits = s[1:] if s[:1] in ("-", "+") else s
+    if not digits.isdecimal() or len(digits) > 9:
         print("Введите число.")
         return None
+    return int(s)
 
 
-def paginate_loop(fetch_page_func, params_for_log: dict, search_type: str):
+def paginate_loop(fetch_page_func, params_for_log: dict, search_type: str) -> Optional[int]:
     """
     Универсальный цикл постраничного просмотра и логирования запросов для фунций поиска по базе фильмов.
-    Получает но��ую страницу результатов при сдвиге offset и логирует только первую страницу.
-    :param fetch_page_func: Функция получения данных по смещению (offset).
+    Получает новую страницу результатов при сдвиге offset и логирует только первую страницу.
+    Общее число результатов запрашивается только для первой страницы и дальше берётся из неё;
+    уже показанные страницы запоминаются, поэтому возврат назад не повторяет запрос к БД.
+    :param fetch_page_func: Функция получения данных по смещению: fetch(offset, include_total).
     :param params_for_log: Параметры поиска, сохраняемые в лог.
     :param search_type: Тип поискового запроса (для лога).
+    :return: Общее число найденных результатов.
     """
     page_size = settings.PAGE_SIZE
     offset = 0
+    total = None
     first_page_logged = False
+    pages = {}
 
     while True:
-        page = fetch_page_func(offset)
+        page = pages.get(offset)
+        if page is None:
+            page = fetch_page_func(offset, include_total=(total is None))
+            pages[offset] = page
         results = page["results"]
-        total = page["total_count"]
+        if total is None:
+            total = page["total_count"]
         has_next = page["has_next"]
 
         print(formatter.format_films_table(results))
@@ -69,14 +81,25 @@ def paginate_loop(fetch_page_func, params_for_log: dict, search_type: str):
 
         if not has_next:
             print("Результаты закончились.")
-            break
-
-        cmd = input_str("Команда: [n] — ещё 10, [q] — назад в меню: ").lower()
-        if cmd == "n":
+            if offset == 0:
+                break
+
+        options = []
+        if has_next:
+            options.append(f"[n] — ещё {page_size}")
+        if offset > 0:
+            options.append("[p] — предыдущие")
+        options.append("[q] — назад в меню")
+        cmd = input_str(f"Команда: {', '.join(options)}: ").lower()
+        if cmd == "n" and has_next:
             offset += page_size
+        elif cmd == "p" and offset > 0:
+            offset -= page_size
         else:
             break
 
+    return total
+
 
 def search_by_keyword():
     """
@@ -88,8 +111,8 @@ def search_by_keyword():
         print("Пустой запрос.")
         return
 
-    def fetch(offset: int):
-        return db.search_by_keyword(keyword, limit=settings.PAGE_SIZE, offset=offset)
+    def fetch(offset: int, include_total: bool = True):
+        return db.search_by_keyword(keyword, limit=settings.PAGE_SIZE, offset=offset, include_total=include_total)
 
     paginate_loop(fetch, {"keyword": keyword}, "keyword")
 
@@ -99,15 +122,14 @@ def search_by_genre_year():
     Режим поиска фильмов по жанру и диапазону годов выпуска.
     Выводит список жанров и диапазон лет, запрашивает ввод пользователя, осуществляет поиск с пагинацией и логированием.
     """
-    genres = db.get_all_genres()
-    min_year, max_year = db.get_year_range()
+    genres, min_year, max_year = db.get_reference()
 
     print("\nДоступные жанры:")
     print(", ".join(genres))
     print(f"\nДиапазон годов выпуска в базе: {min_year} — {max_year}\n")
 
     genre = input_str("Укажите жанр (точно как в списке): ")
-    if genre not in genres:
+    if genre not in db.get_genre_set():
         print("Такой жанр не найден.")
         return
 
@@ -125,8 +147,9 @@ def search_by_genre_year():
             print("Некорректный диапазон.")
             y_to = None
 
-    def fetch(offset: int):
-        return db.search_by_genre_year(genre, y_from, y_to, limit=settings.PAGE_SIZE, offset=offset)
+    def fetch(offset: int, include_total: bool = True):
+        return db.search_by_genre_year(genre, y_from, y_to, limit=settings.PAGE_SIZE, offset=offset,
+                                       include_total=include_total)
 
     paginate_loop(fetch, {"genre": genre, "year_from": y_from, "year_to": y_to}, "genre_year")
 
@@ -149,6 +172,16 @@ def show_latest():
     print(formatter.format_queries_list(rows))
 
 
+# Пункты меню: клавиша -> (подпись, обработчик); None вместо обработчика — выход.
+DISPATCH = {
+    "1": ("Поиск по ключевому слову", search_by_keyword),
+    "2": ("Поиск по жанру и диапазону годов", search_by_genre_year),
+    "3": ("Показать популярные запросы (топ-5)", show_popular),
+    "4": ("Показать последние уникальные запросы (5)", show_latest),
+    "0": ("Выход", None),
+}
+
+
 def main():
     """
     Главная функция консольного приложения: показывает меню, получает выбор пользователя,
@@ -158,29 +191,23 @@ def main():
     print(f"MongoDB: база '{settings.MONGODB_DATABASE}', коллекция '{settings.MONGODB_COLLECTION_NAME}'")
     print(f"MySQL: база '{settings.DATABASE}', хост '{settings.HOST}'\n")
 
+    menu_text = "\nМеню:\n" + "\n".join(f"{key}. {label}" for key, (label, _) in DISPATCH.items())
+
     while True:
-        print("\nМеню:")
-        print("1. Поиск по ключевому слову")
-        print("2. Поиск по жанру и диапазону годов")
-        print("3. Показать популярные запросы (топ-5)")
-        print("4. Показать последние уникальные запросы (5)")
-        print("0. Выход")
+        print(menu_text)
 
         choice = input_str("Выбор: ")
-        if choice == "1":
-            search_by_keyword()
-        elif choice == "2":
-            search_by_genre_year()
-        elif choice == "3":
-            show_popular()
-        elif choice == "4":
-            show_latest()
-        elif choice == "0":
+        entry = DISPATCH.get(choice)
+        if entry is None:
+            print("Неверный выбор.")
+            continue
+        handler = entry[1]
+        if handler is None:
             print("Пока!")
             break
-        else:
-            print("Неверный выбор.")
+        handler()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main()
\ No newline at end of file
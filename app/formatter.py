@@ -1,4 +1,30 @@
-from typing import List, Dict
+from datetime import datetime
+from operator import itemgetter
+from typing import List, Dict, Any
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+FILM_HEADERS = ("#", "Название", "Год", "Рейтинг", "Жанр")
+_FILM_COLUMNS = range(len(FILM_HEADERS))
+# поля строки фильма в порядке колонок (после "#"); itemgetter достаёт их одним вызовом на C
+FILM_FIELDS = ("title", "release_year", "rating", "genre")
+_film_values = itemgetter(*FILM_FIELDS)
+
+QUERY_POPULAR_TMPL = "{}. {} | {} | частота: {}"
+QUERY_LATEST_TMPL = "{}. {} | {} | время: {} | результаты: {}"
+
+
+def format_timestamp(value: Any) -> str:
+    """
+    Приводит время запроса к строке вида "YYYY-MM-DD HH:MM:SS".
+    Старые записи логов хранят время строкой — они выводятся как есть.
+
+    :param value: datetime (BSON Date) или строка.
+    :return: Строковое представление времени.
+    """
+    if isinstance(value, datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    return "" if value is None else str(value)
 
 
 def format_films_table(rows: List[Dict]) -> str:
@@ -13,25 +39,26 @@ def format_films_table(rows: List[Dict]) -> str:
     if not rows:
         return "Нет результатов."
 
-    headers = ["#", "Название", "Год", "Рейтинг", "Жанр"]
+    widths = [len(h) for h in FILM_HEADERS]
     data = []
+    # один проход: строковые значения и ширины колонок считаются одновременно
     for idx, r in enumerate(rows, start=1):
-        data.append([
-            str(idx),
-            str(r.get("title", "")),
-            str(r.get("release_year", "")),
-            str(r.get("rating", "")),
-            str(r.get("genre", "")),
-        ])
-
-    # compute column widths
-    widths = [max(len(h), *(len(row[i]) for row in data)) for i, h in enumerate(headers)]
-
-    def fmt_row(row_vals):
-        return " | ".join(val.ljust(widths[i]) for i, val in enumerate(row_vals))
-
-    lines = [fmt_row(headers), "-+-".join("-" * w for w in widths)]
-    lines.extend(fmt_row(row) for row in data)
+        try:
+            values = _film_values(r)
+        except KeyError:
+            values = [r.get(k, "") for k in FILM_FIELDS]
+        row = [str(idx), *map(str, values)]
+        for i in _FILM_COLUMNS:
+            n = len(row[i])
+            if n > widths[i]:
+                widths[i] = n
+        data.append(row)
+
+    # шаблон строки собирается один раз, дальше — один вызов format на строку
+    fmt = " | ".join(f"{{:<{w}}}" for w in widths)
+
+    lines = [fmt.format(*FILM_HEADERS), "-+-".join("-" * w for w in widths)]
+    lines += [fmt.format(*row) for row in data]
     return "\n".join(lines)
 
 
@@ -47,11 +74,14 @@ def format_queries_list(rows: List[Dict]) -> str:
     if not rows:
         return "Нет данных."
 
-    lines = []
-    for i, r in enumerate(rows, start=1):
-        if "count" in r:
-            lines.append(f"{i}. {r.get('search_type')} | {r.get('params')} | частота: {r.get('count')}")
-        else:
-            lines.append(
-                f"{i}. {r.get('search_type')} | {r.get('params')} | время: {r.get('timestamp')} | результаты: {r.get('results_count')}")
-    return "\n".join(lines)
\ No newline at end of file
+    # все строки одного списка имеют одну форму (из одной агрегации) — шаблон выбирается один раз
+    if "count" in rows[0]:
+        return "\n".join(
+            QUERY_POPULAR_TMPL.format(i, r.get("search_type"), r.get("params"), r.get("count"))
+            for i, r in enumerate(rows, start=1)
+        )
+    return "\n".join(
+        QUERY_LATEST_TMPL.format(i, r.get("search_type"), r.get("params"),
+                                 format_timestamp(r.get("timestamp")), r.get("results_count"))
+        for i, r in enumerate(rows, start=1)
+    )
@@ -1,23 +1,135 @@
-from typing import List, Dict, Any
+import functools
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple
 
-from pymongo import MongoClient
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import PyMongoError
 import local_settings as settings
+import log_writer
+
+logger = logging.getLogger(__name__)
+
+# Коллекция создаётся один раз на процесс поверх общего с log_writer MongoClient.
+_coll = None
 
 
 def _get_collection():
     """
     Возвращает MongoDB коллекцию для логирования поисковых запросов.
+    При первом вызове создаёт индексы под агрегации статистики и проставляет params_key
+    старым записям; если что-то из этого не удалось, коллекция не запоминается
+    и следующий вызов попробует снова.
 
     :return: Объект коллекции pymongo Collection.
     """
-    client = MongoClient(settings.MONGODB_URL)
-    db = client[settings.MONGODB_DATABASE]
-    return db[settings.MONGODB_COLLECTION_NAME]
+    global _coll
+    if _coll is not None:
+        return _coll
+    coll = log_writer.get_client()[settings.MONGODB_DATABASE][settings.MONGODB_COLLECTION_NAME]
+    indexed = _ensure_indexes(coll)
+    if _backfill_params_key(coll) and indexed:
+        _coll = coll
+    return coll
+
+
+# Сколько последних записей лога просматривает get_latest_unique.
+LATEST_SCAN_LIMIT = getattr(settings, "LATEST_SCAN_LIMIT", 1000)
+
+# Если задано — индекс по timestamp становится TTL-индексом и MongoDB сама удаляет
+# записи старше LOG_TTL_DAYS дней (работает только для timestamp типа Date).
+LOG_TTL_DAYS = getattr(settings, "LOG_TTL_DAYS", None)
+
+TIMESTAMP_INDEX = [("timestamp", DESCENDING)]
+BACKFILL_BATCH = 1000  # записей в одном bulk_write при простановке params_key
+
+# Запросы группируются по строке params_key (канонический JSON параметров, см. log_writer):
+# строку сравнивать дешевле, чем вложенный документ, и порядок ключей в params не важен.
+# Старым записям без params_key он проставляется один раз (_backfill_params_key).
+_GROUP_KEY = {"search_type": "$search_type", "params_key": "$params_key"}
+
+
+def _ensure_indexes(coll) -> bool:
+    """
+    Создаёт индексы под агрегации статистики (create_index идемпотентен).
+    Смена LOG_TTL_DAYS для уже созданного индекса требует удалить его вручную.
+    Ошибка создания не мешает чтению статистики — пайплайны просто пойдут без индексов.
+
+    :param coll: Коллекция логов запросов.
+    :return: True, если индексы созданы (или уже были).
+    """
+    try:
+        if LOG_TTL_DAYS:
+            coll.create_index(TIMESTAMP_INDEX, expireAfterSeconds=int(LOG_TTL_DAYS) * 86400)
+        else:
+            coll.create_index(TIMESTAMP_INDEX)
+        return True
+    except PyMongoError as e:
+        logger.warning("MongoDB create_index failed: %s", e)
+        return False
+
+
+def _backfill_params_key(coll) -> bool:
+    """
+    Проставляет params_key записям лога, сделанным до его появления, — тем же
+    log_writer.params_key, что и при записи, чтобы одинаковые запросы попадали в одну группу.
+    Выполняется один раз на процесс; когда старых записей нет, это один пустой find.
+
+    :param coll: Коллекция логов запросов.
+    :return: True, если все записи имеют params_key.
+    """
+    try:
+        batch = []
+        for doc in coll.find({"params_key": {"$exists": False}}, {"params": 1}):
+            key = log_writer.params_key(doc.get("params"))
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"params_key": key}}))
+            if len(batch) >= BACKFILL_BATCH:
+                coll.bulk_write(batch, ordered=False)
+                batch = []
+        if batch:
+            coll.bulk_write(batch, ordered=False)
+        return True
+    except PyMongoError as e:
+        logger.warning("MongoDB params_key backfill failed: %s", e)
+        return False
+
 
+# Результаты агрегаций кэшируются на несколько секунд: /stats не пересчитывает их на каждый запрос.
+STATS_CACHE_TTL = getattr(settings, "STATS_CACHE_TTL", 30)
+_stats_cache: Dict[Tuple[str, int], Tuple[float, List[Dict[str, Any]]]] = {}
 
+
+def _stats_cached(func):
+    """
+    Кэширует результат функции статистики по (имя функции, limit) на STATS_CACHE_TTL секунд.
+    Ошибки не кэшируются.
+    """
+    @functools.wraps(func)
+    def wrapper(limit: int = 5) -> List[Dict[str, Any]]:
+        key = (func.__name__, int(limit))
+        now = time.monotonic()
+        hit = _stats_cache.get(key)
+        if hit is not None and hit[0] > now:
+            return hit[1]
+        value = func(limit)
+        _stats_cache[key] = (now + STATS_CACHE_TTL, value)
+        return value
+
+    return wrapper
+
+
+def invalidate_stats_cache() -> None:
+    """
+    Сбрасывает кэш статистики, следующий вызов заново выполнит агрегации.
+    """
+    _stats_cache.clear()
+
+
+@_stats_cached
 def get_top_popular(limit: int = 5) -> List[Dict[str, Any]]:
     """
-    Возвращает top-N популярных поисковых запросов, группируя по (search_type, params).
+    Возвращает top-N популярных поисковых запросов, группируя по (search_type, params_key).
     Для каждой уникальной пары указывает частоту запросов.
 
     :param limit: Максимальное количество популярных записей в результате.
@@ -25,27 +137,36 @@ def get_top_popular(limit: int = 5) -> List[Dict[str, Any]]:
     """
     coll = _get_collection()
     pipeline = [
-        {"$group": {"_id": {"search_type": "$search_type", "params": "$params"}, "count": {"$sum": 1}}},
+        {"$project": {"_id": 0, "search_type": 1, "params": 1, "params_key": 1}},
+        {"$group": {"_id": _GROUP_KEY, "params": {"$first": "$params"}, "count": {"$sum": 1}}},
         {"$sort": {"count": -1}},
         {"$limit": int(limit)},
-        {"$project": {"_id": 0, "search_type": "$_id.search_type", "params": "$_id.params", "count": 1}},
+        {"$project": {"_id": 0, "search_type": "$_id.search_type", "params": 1, "count": 1}},
     ]
-    return list(coll.aggregate(pipeline))
+    return list(coll.aggregate(pipeline, allowDiskUse=True))
 
 
+@_stats_cached
 def get_latest_unique(limit: int = 5) -> List[Dict[str, Any]]:
     """
     Возвращает N самых последних уникальных поисковых запросов (по search_type, params),
-    отсортированных по убыванию времени запроса.
+    отсортированных по убыванию времени запроса. Уникальные запросы ищутся среди
+    последних LATEST_SCAN_LIMIT записей лога.
 
     :param limit: Максимальное число уникальных последних запросов.
     :return: Список словарей с ключами: search_type, params, timestamp, results_count.
     """
     coll = _get_collection()
+    # $project стоит сразу после $sort: сортировка остаётся первой и идёт по индексу,
+    # а в $group попадают только нужные поля. $limit после $sort ограничивает группировку
+    # последними LATEST_SCAN_LIMIT записями — по индексу это O(k), а не вся коллекция.
     pipeline = [
         {"$sort": {"timestamp": -1}},
+        {"$limit": max(int(LATEST_SCAN_LIMIT), int(limit))},
+        {"$project": {"_id": 0, "search_type": 1, "params": 1, "params_key": 1, "timestamp": 1, "results_count": 1}},
         {"$group": {
-            "_id": {"search_type": "$search_type", "params": "$params"},
+            "_id": _GROUP_KEY,
+            "params": {"$first": "$params"},
             "timestamp": {"$first": "$timestamp"},
             "results_count": {"$first": "$results_count"}
         }},
@@ -54,9 +175,26 @@ def get_latest_unique(limit: int = 5) -> List[Dict[str, Any]]:
         {"$project": {
             "_id": 0,
             "search_type": "$_id.search_type",
-            "params": "$_id.params",
+            "params": 1,
             "timestamp": 1,
             "results_count": 1
         }},
     ]
-    return list(coll.aggregate(pipeline))
\ No newline at end of file
+    # $sort по timestamp идёт первым этапом, и планировщик сам читает его по индексу, если тот есть;
+    # hint не передаём — без индекса MongoDB отвергла бы запрос с hint
+    return list(coll.aggregate(pipeline, allowDiskUse=True))
+
+
+# Две агрегации страницы статистики выполняются параллельно: время ответа — один round-trip, а не два.
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="log-stats")
+
+
+def submit_stats(limit: int = 5) -> Tuple[Future, Future]:
+    """
+    Запускает get_top_popular и get_latest_unique одновременно в фоновых потоках.
+    Ошибка каждой агрегации поднимается из .result() соответствующего Future.
+
+    :param limit: Размер обоих списков.
+    :return: Пара Future: (популярные, последние уникальные).
+    """
+    return _executor.submit(get_top_popular, limit), _executor.submit(get_latest_unique, limit)
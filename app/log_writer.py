@@ -1,10 +1,58 @@
-from datetime import datetime
-from typing import Dict, Any
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List
 
-from pymongo import MongoClient
+from pymongo import MongoClient, WriteConcern
 from pymongo.errors import PyMongoError
 import local_settings as settings
 
+logger = logging.getLogger(__name__)
+
+# Клиент и коллекция создаются один раз на процесс: MongoClient сам держит пул соединений.
+MONGODB_TIMEOUT_MS = getattr(settings, "MONGODB_TIMEOUT_MS", 2000)
+MONGODB_POOL_SIZE = getattr(settings, "MONGODB_POOL_SIZE", 20)
+_client = None
+_coll = None
+_batch_coll = None
+
+# Логи пишутся в фоне: log_query только кладёт документ в очередь,
+# а поток-писатель сбрасывает накопленное пачками через insert_many.
+QUEUE_MAXSIZE = getattr(settings, "LOG_QUEUE_MAXSIZE", 10_000)
+BATCH_SIZE = getattr(settings, "LOG_BATCH_SIZE", 1000)
+FLUSH_INTERVAL = getattr(settings, "LOG_FLUSH_INTERVAL", 0.2)  # секунды ожидания добора пачки
+
+# Типы поиска, для которых запросы без результатов не логируются (например, ("keyword",) —
+# опечатки в ключевом слове). По умолчанию логируются все запросы.
+LOG_SKIP_EMPTY = frozenset(getattr(settings, "LOG_SKIP_EMPTY", ()))
+
+_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=QUEUE_MAXSIZE)
+_writer = None
+_writer_lock = threading.Lock()
+dropped_count = 0
+
+
+def get_client() -> MongoClient:
+    """
+    Возвращает общий на процесс MongoClient (его же использует log_stats).
+    Создаётся лениво при первом вызове; короткий serverSelectionTimeoutMS
+    не даёт недоступной MongoDB надолго подвешивать запросы.
+
+    :return: Объект pymongo MongoClient.
+    """
+    global _client
+    if _client is None:
+        _client = MongoClient(
+            settings.MONGODB_URL,
+            serverSelectionTimeoutMS=MONGODB_TIMEOUT_MS,
+            maxPoolSize=MONGODB_POOL_SIZE,
+        )
+    return _client
+
 
 def get_collection():
     """
@@ -12,29 +60,127 @@ def get_collection():
 
     :return: Объект коллекции pymongo Collection.
     """
-    client = MongoClient(settings.MONGODB_URL)
-    db = client[settings.MONGODB_DATABASE]
-    return db[settings.MONGODB_COLLECTION_NAME]
+    global _coll
+    if _coll is None:
+        _coll = get_client()[settings.MONGODB_DATABASE][settings.MONGODB_COLLECTION_NAME]
+    return _coll
+
+
+def _get_batch_collection():
+    """
+    Возвращает коллекцию логов с write concern w=0 для фоновой записи пачек:
+    логи — некритичная телеметрия, подтверждение записи от сервера не ждём.
+
+    :return: Объект коллекции pymongo Collection.
+    """
+    global _batch_coll
+    if _batch_coll is None:
+        _batch_coll = get_collection().with_options(write_concern=WriteConcern(w=0))
+    return _batch_coll
+
+
+def _insert_batch(batch: List[Dict[str, Any]]) -> None:
+    """
+    Вставляет пачку документов в MongoDB одним неупорядоченным запросом без подтверждения.
+    В случае ошибки пишет предупреждение в лог, документы пачки теряются.
+
+    :param batch: Список документов логов.
+    :return: None
+    """
+    try:
+        _get_batch_collection().insert_many(batch, ordered=False)
+    except PyMongoError as e:
+        logger.warning("MongoDB insert failed: %s", e)
+
+
+def _writer_loop() -> None:
+    """
+    Цикл фонового потока: ждёт первый документ, затем добирает пачку
+    до BATCH_SIZE документов или до истечения FLUSH_INTERVAL и записывает её.
+    """
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        _insert_batch(batch)
+
+
+def _ensure_writer() -> None:
+    """
+    Запускает фоновый поток-писатель при первом обращении (после fork воркера, а не при импорте).
+    """
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_writer_loop, name="log-writer", daemon=True)
+            _writer.start()
+
+
+def flush_pending() -> None:
+    """
+    Синхронно записывает документы, оставшиеся в очереди.
+    Вызывается при завершении процесса, чтобы не потерять последние логи.
+
+    :return: None
+    """
+    batch = []
+    while True:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        _insert_batch(batch)
+
+
+atexit.register(flush_pending)
+
+
+def params_key(params: Dict[str, Any]) -> str:
+    """
+    Канонический ключ параметров поиска: JSON с отсортированными ключами без пробелов.
+    Одинаковые параметры дают одинаковую строку независимо от порядка ключей в dict.
+
+    :param params: Параметры поиска.
+    :return: Строка-ключ для группировки в статистике.
+    """
+    return json.dumps(params, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
 
 
 def log_query(search_type: str, params: Dict[str, Any], results_count: int) -> None:
     """
-    Записывает информацию о выполненном поисковом запросе в базу MongoDB.
-    В случае ошибки логирования (например, отказ в доступе) выводит предупреждение в консоль.
+    Ставит информацию о выполненном поисковом запросе в очередь на запись в MongoDB.
+    Не блокирует вызывающего: запись выполняет фоновый поток. Если очередь переполнена,
+    документ отбрасывается и увеличивается счётчик dropped_count.
+    Запросы без результатов для типов из LOG_SKIP_EMPTY не логируются.
 
     :param search_type: Тип поиска (например, 'keyword', 'genre_year').
     :param params: Параметры поиска (например, ключевое слово, жанр, годы).
     :param results_count: Количество найденных результатов по данному запросу.
     :return: None
     """
+    global dropped_count
+    if not results_count and search_type in LOG_SKIP_EMPTY:
+        return
     doc = {
-        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        # BSON Date: сортировка и индекс по timestamp работают с 8-байтным числом, а не со строкой
+        "timestamp": datetime.now(timezone.utc),
         "search_type": search_type,
         "params": params,
+        "params_key": params_key(params),
         "results_count": int(results_count),
     }
+    _ensure_writer()
     try:
-        coll = get_collection()
-        coll.insert_one(doc)
-    except PyMongoError as e:
-        print(f"[LOGGING WARNING] MongoDB insert failed: {e}")
\ No newline at end of file
+        _queue.put_nowait(doc)
+    except queue.Full:
+        dropped_count += 1
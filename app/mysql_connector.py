@@ -1,48 +1,304 @@
-import mysql.connector
-from typing import Tuple, List, Dict, Any, Optional
-from datetime import datetime
+import functools
+import logging
+import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from mysql.connector import errors, pooling
+from typing import Tuple, List, Dict, Any, Optional, FrozenSet
+from datetime import datetime, timezone
 
 import local_settings as settings
 
+logger = logging.getLogger(__name__)
 
-def _get_conn():
+
+# Пул соединений создаётся один раз на процесс; conn.close() у соединения из пула
+# не рвёт сессию, а возвращает её в пул.
+POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", getattr(settings, "MYSQL_POOL_SIZE", 8)))
+# Приложение не меняет состояние сессии (только SELECT с autocommit), поэтому сброс сессии
+# (COM_RESET_CONNECTION) при каждом возврате соединения в пул — лишний round-trip.
+POOL_RESET_SESSION = getattr(settings, "MYSQL_POOL_RESET_SESSION", False)
+POOL_TIMEOUT = getattr(settings, "MYSQL_POOL_TIMEOUT", 5)  # секунды ожидания свободного соединения
+# C-расширение mysql.connector разбирает строки результата в C; если оно не установлено,
+# mysql.connector сам возвращается к чистому Python.
+USE_PURE = getattr(settings, "MYSQL_USE_PURE", False)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _conn_config() -> Dict[str, Any]:
     cfg = getattr(settings, "MYSQL_CONFIG", None)
     if cfg:
-        return mysql.connector.connect(**cfg)
-    return mysql.connector.connect(
+        cfg = dict(cfg)
+        cfg.setdefault("autocommit", True)
+        cfg.setdefault("use_pure", USE_PURE)
+        return cfg
+    return dict(
         host=getattr(settings, "HOST", "localhost"),
         user=getattr(settings, "USER", "root"),
         password=getattr(settings, "PASSWORD", ""),
         database=getattr(settings, "DATABASE", ""),
         port=getattr(settings, "PORT", 3306),
         autocommit=True,
+        use_pure=USE_PURE,
     )
 
 
-def get_all_genres() -> List[str]:
-    conn = _get_conn()
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM category ORDER BY name")
-        return [r[0] for r in cur.fetchall() if r and r[0] is not None]
-    finally:
+def _get_conn():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pooling.MySQLConnectionPool(pool_name="app", pool_size=POOL_SIZE,
+                                                    pool_reset_session=POOL_RESET_SESSION, **_conn_config())
+    # пул mysql.connector не блокируется сам: при исчерпании сразу бросает PoolError,
+    # поэтому при параллельных запросах ждём освобождения соединения до POOL_TIMEOUT
+    deadline = time.monotonic() + POOL_TIMEOUT
+    while True:
         try:
-            cur.close()
+            return _pool.get_connection()
+        except errors.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.01)
+
+
+_TOTAL_SQL = ", COUNT(*) OVER () AS total_cnt"
+
+# Поиск по ключевому слову идёт через FULLTEXT-индекс ft_title_desc (см. sql/001_film_fulltext.sql).
+# Слова короче innodb_ft_min_token_size в индекс не попадают — для таких запросов остаётся LIKE.
+# Если индекса в базе нет (MySQL 1191), поиск сам переключается на LIKE до перезапуска процесса.
+FULLTEXT_SEARCH = getattr(settings, "FULLTEXT_SEARCH", True)
+FT_MIN_TOKEN_SIZE = getattr(settings, "FT_MIN_TOKEN_SIZE", 3)
+# стоп-слова InnoDB по умолчанию (INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD): в индекс не попадают,
+# поэтому обязательное "+the*" не нашло бы ничего — такие слова в AGAINST не передаются
+FT_STOPWORDS = frozenset(getattr(settings, "FT_STOPWORDS", (
+    "a", "about", "an", "are", "as", "at", "be", "by", "com", "de", "en", "for", "from", "how", "i",
+    "in", "is", "it", "la", "of", "on", "or", "that", "the", "this", "to", "was", "what", "when",
+    "where", "who", "will", "with", "und", "www",
+)))
+ER_FT_MATCHING_KEY_NOT_FOUND = 1191
+_fulltext_available = True
+_WORD_RE = re.compile(r"\w+")
+
+
+@functools.lru_cache(maxsize=256)
+def _keyword_clause(q: str, fulltext: bool = True) -> Tuple[str, Tuple[Any, ...]]:
+    """
+    Строит условие WHERE для поиска по ключевому слову и его параметры.
+    Если fulltext и все слова запроса (кроме стоп-слов) достаточно длинные — MATCH ... AGAINST
+    в BOOLEAN MODE вида "+word1* +word2*" (каждое слово обязательно, по префиксу), иначе — LIKE '%q%'.
+    Результат кэшируется: все страницы одного запроса используют готовый шаблон и параметры.
+    """
+    words = [w for w in _WORD_RE.findall(q) if w.lower() not in FT_STOPWORDS]
+    if fulltext and words and all(len(w) >= FT_MIN_TOKEN_SIZE for w in words):
+        against = " ".join(f"+{w}*" for w in words)
+        return "MATCH(f.title, f.description) AGAINST (%s IN BOOLEAN MODE)", (against,)
+    like = f"%{q}%"
+    return "(f.title LIKE %s OR f.description LIKE %s)", (like, like)
+
+
+def _fetch_page(conn, cur, limit: int) -> List[Dict[str, Any]]:
+    """
+    Читает строки страницы (запрос сделан с LIMIT limit+1) через fetchmany и, если сервер
+    прислал что-то сверх этого, дочитывает остаток — соединение должно вернуться в пул без
+    непрочитанного результата.
+    """
+    rows = cur.fetchmany(int(limit) + 1)
+    if conn.unread_result:
+        cur.fetchall()
+    return rows
+
+
+def _extract_total(rows: List[Dict[str, Any]], include_total: bool, from_start: bool) -> Optional[int]:
+    """
+    Достаёт общее число совпадений из колонки total_cnt первой строки.
+    Возвращает None, если подсчёт не запрашивался, а также для пустой страницы не с начала выборки
+    (from_start=False): оконная функция не вернула ни одной строки, и общее число неизвестно.
+    """
+    if not include_total:
+        return None
+    if not rows:
+        return 0 if from_start else None
+    return int(rows[0].get("total_cnt", 0))
+
+
+# Prepared-курсоры поисковых запросов переиспользуются на соединении: повторный execute того же
+# текста SQL не делает PREPARE заново. Возможно только без сброса сессии при возврате в пул —
+# COM_RESET_CONNECTION удаляет prepared statements на сервере.
+PREPARED_CACHE = getattr(settings, "MYSQL_PREPARED_CACHE", not POOL_RESET_SESSION)
+PREPARED_CACHE_SIZE = getattr(settings, "MYSQL_PREPARED_CACHE_SIZE", 32)  # курсоров на соединение
+# реальное соединение -> (id серверной сессии, {текст SQL: (тот же текст, курсор)});
+# запись исчезает вместе с соединением
+_prepared: "weakref.WeakKeyDictionary[Any, Tuple[Any, OrderedDict]]" = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
+
+def _session_cursors(conn) -> OrderedDict:
+    """
+    Кэш prepared-курсоров текущей серверной сессии соединения. Пул при выдаче устаревшего
+    соединения молча делает reconnect() того же объекта — prepared statements старой сессии
+    на сервере уже нет, поэтому при смене connection_id кэш сбрасывается.
+    """
+    raw = getattr(conn, "_cnx", conn)  # PooledMySQLConnection -> реальное соединение
+    session_id = conn.connection_id
+    with _prepared_lock:
+        entry = _prepared.get(raw)
+        if entry is not None and entry[0] == session_id:
+            return entry[1]
+        cursors: OrderedDict = OrderedDict()
+        _prepared[raw] = (session_id, cursors)
+    if entry is not None:
+        for _, cur in entry[1].values():
+            _close_cursor(cur)
+    return cursors
+
+
+def _execute_prepared(conn, sql: str, params: Tuple):
+    """
+    Выполняет sql через prepared dictionary-курсор и возвращает курсор. При включённом
+    PREPARED_CACHE курсор берётся из кэша соединения (соединение из пула в каждый момент
+    у одного потока), при переполнении кэша самый старый курсор закрывается.
+    Если кэшированный курсор не сработал, запрос один раз повторяется на заново подготовленном.
+    """
+    if not PREPARED_CACHE:
+        cur = conn.cursor(dictionary=True, prepared=True)
+        cur.execute(sql, params)
+        return cur
+    cursors = _session_cursors(conn)
+    hit = cursors.get(sql)
+    if hit is not None:
+        cursors.move_to_end(sql)
+        # курсор пропускает PREPARE, только если получил тот же объект строки, что и в прошлый раз
+        # (сравнение по is), поэтому выполняется сохранённый в кэше текст
+        cached_sql, cur = hit
+        try:
+            cur.execute(cached_sql, params)
+            return cur
         except Exception:
-            pass
-        conn.close()
+            # prepared statement на сервере мог пропасть — готовим заново
+            cursors.pop(sql, None)
+            _close_cursor(cur)
+    cur = conn.cursor(dictionary=True, prepared=True)
+    try:
+        cur.execute(sql, params)
+    except Exception:
+        _close_cursor(cur)
+        raise
+    cursors[sql] = (sql, cur)
+    while len(cursors) > PREPARED_CACHE_SIZE:
+        _close_cursor(cursors.popitem(last=False)[1][1])
+    return cur
+
+
+def _close_cursor(cur) -> None:
+    try:
+        cur.close()
+    except Exception:
+        pass
+
+
+def _release_cursor(conn, sql: str, cur, ok: bool) -> None:
+    """
+    Завершает работу с курсором из _execute_prepared: после успешного запроса кэшированный курсор
+    остаётся на соединении, иначе (ошибка, соединение могло переподключиться) — закрывается
+    и удаляется из кэша.
+    """
+    if cur is None:
+        return
+    entry = _prepared.get(getattr(conn, "_cnx", conn)) if PREPARED_CACHE else None
+    cursors = entry[1] if entry is not None else None
+    hit = cursors.get(sql) if cursors is not None else None
+    if hit is not None and hit[1] is cur:
+        if ok:
+            return
+        del cursors[sql]
+    _close_cursor(cur)
+
+
+# Справочные данные (жанры, диапазон лет) меняются редко — держим их в памяти процесса.
+REFERENCE_TTL = getattr(settings, "REFERENCE_CACHE_TTL", 300)
+# Ошибка обращения к БД запоминается на несколько секунд: при недоступном MySQL запросы
+# не выстраиваются в очередь за повторными попытками подключения.
+REFERENCE_ERROR_TTL = getattr(settings, "REFERENCE_ERROR_TTL", 5)
+# имя функции -> (истекает, значение, исключение или None)
+_reference_cache: Dict[str, Tuple[float, Any, Optional[Exception]]] = {}
 
 
-def get_year_range() -> Tuple[int, int]:
+def _reference_hit(hit: Tuple[float, Any, Optional[Exception]]) -> Any:
+    if hit[2] is not None:
+        # каждый поток получает новое исключение: повторный raise общего объекта
+        # наращивал бы его __traceback__ от запроса к запросу
+        raise RuntimeError(str(hit[2])) from hit[2]
+    return hit[1]
+
+
+def _reference_cached(func):
+    """
+    Кэширует результат функции без аргументов на REFERENCE_TTL секунд (по монотонным часам),
+    ошибку — на REFERENCE_ERROR_TTL секунд.
+    Когда запись устарела, в БД идёт только один поток, остальные ждут и получают его результат
+    (или его ошибку). Блокировка у каждой функции своя.
+    """
+    key = func.__name__
+    lock = threading.Lock()
+
+    @functools.wraps(func)
+    def wrapper():
+        hit = _reference_cache.get(key)
+        if hit is not None and hit[0] > time.monotonic():
+            return _reference_hit(hit)
+        with lock:
+            # пока ждали блокировку, кэш мог обновить другой поток
+            hit = _reference_cache.get(key)
+            if hit is not None and hit[0] > time.monotonic():
+                return _reference_hit(hit)
+            try:
+                value = func()
+            except Exception as e:
+                _reference_cache[key] = (time.monotonic() + REFERENCE_ERROR_TTL, None, e)
+                raise
+            _reference_cache[key] = (time.monotonic() + REFERENCE_TTL, value, None)
+            return value
+
+    return wrapper
+
+
+def invalidate_reference_cache() -> None:
+    """
+    Сбрасывает кэш справочных данных, следующий вызов перечитает их из БД.
+    """
+    _reference_cache.clear()
+
+
+@_reference_cached
+def get_reference() -> Tuple[List[str], int, int]:
+    """
+    Возвращает справочные данные одним запросом (один round-trip):
+    (список жанров, минимальный год, максимальный год).
+    Диапазон лет — однострочный подзапрос, к нему присоединяются жанры; LEFT JOIN
+    гарантирует строку с годами даже при пустой таблице category.
+    """
     conn = _get_conn()
     try:
         cur = conn.cursor()
-        cur.execute("SELECT MIN(release_year), MAX(release_year) FROM film")
-        r = cur.fetchone()
-        if r and r[0] is not None and r[1] is not None:
-            return int(r[0]), int(r[1])
-        # safe defaults when DB empty
-        return 1900, datetime.utcnow().year
+        cur.execute("""
+            SELECT y.min_year, y.max_year, c.name
+            FROM (SELECT MIN(release_year) AS min_year, MAX(release_year) AS max_year FROM film) y
+            LEFT JOIN category c ON TRUE
+            ORDER BY c.name
+        """)
+        rows = cur.fetchall()
+        genres = [r[2] for r in rows if r[2] is not None]
+        min_year, max_year = rows[0][0], rows[0][1]
+        if min_year is None or max_year is None:
+            # safe defaults when DB empty
+            return genres, 1900, datetime.now(timezone.utc).year
+        return genres, int(min_year), int(max_year)
     finally:
         try:
             cur.close()
@@ -51,11 +307,65 @@ def get_year_range() -> Tuple[int, int]:
         conn.close()
 
 
-def search_by_genre_year(genre: Optional[str], year_from: int, year_to: int, limit: int = 10, offset: int = 0) -> Dict[str, Any]:
+@_reference_cached
+def get_genre_set() -> FrozenSet[str]:
+    """
+    Возвращает множество жанров для проверки принадлежности за O(1).
+    Строится из get_reference() и живёт в том же кэше справочных данных.
+    """
+    return frozenset(get_reference()[0])
+
+
+# Страницы результатов поиска кэшируются ненадолго: переход назад/вперёд по страницам
+# того же запроса не идёт в БД. Размер кэша ограничен, вытесняются самые старые записи.
+SEARCH_CACHE_TTL = getattr(settings, "SEARCH_CACHE_TTL", 120)
+SEARCH_CACHE_SIZE = getattr(settings, "SEARCH_CACHE_SIZE", 256)
+_search_cache: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_search_cache_lock = threading.Lock()
+
+
+def _search_cached(func):
+    """
+    Кэширует результат функции поиска по её аргументам на SEARCH_CACHE_TTL секунд (LRU
+    на SEARCH_CACHE_SIZE записей). Ошибки не кэшируются.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (func.__name__, args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with _search_cache_lock:
+            hit = _search_cache.get(key)
+            if hit is not None and hit[0] > now:
+                _search_cache.move_to_end(key)
+                return hit[1]
+        value = func(*args, **kwargs)
+        with _search_cache_lock:
+            _search_cache[key] = (now + SEARCH_CACHE_TTL, value)
+            _search_cache.move_to_end(key)
+            while len(_search_cache) > SEARCH_CACHE_SIZE:
+                _search_cache.popitem(last=False)
+        return value
+
+    return wrapper
+
+
+def invalidate_search_cache() -> None:
+    """
+    Сбрасывает кэш страниц поиска (например, после перезагрузки данных каталога).
+    """
+    with _search_cache_lock:
+        _search_cache.clear()
+
+
+@_search_cached
+def search_by_genre_year(genre: Optional[str], year_from: int, year_to: int, limit: int = 10, offset: int = 0,
+                         include_total: bool = True) -> Dict[str, Any]:
     """
     Ищет фильмы с release_year BETWEEN year_from AND year_to (включительно).
     Если genre is not None — применяет фильтр по жанру (равенство).
-    Возвращает dict: {results: [...], total_count: int, has_next: bool}
+    Если include_total=False — общее число не считается (total_count=None), has_next
+    определяется по лишней строке из LIMIT+1.
+    Возвращает dict: {results: [...], total_count: int | None, has_next: bool}
     """
     yf = int(year_from)
     yt = int(year_to)
@@ -63,87 +373,106 @@ def search_by_genre_year(genre: Optional[str], year_from: int, year_to: int, lim
         yf, yt = yt, yf
 
     conn = _get_conn()
+    cur = None
+    data_query = ""
+    ok = False
     try:
-        # используем dictionary cursor, чтобы возвращать удобные dict'ы
-        cur = conn.cursor(dictionary=True)
+        # dictionary cursor возвращает удобные dict'ы; prepared — серверный prepared statement
+        # с бинарным протоколом, параметры (включая LIMIT/OFFSET) передаются отдельно от текста SQL;
+        # курсор на каждый текст запроса готовится один раз на соединение (_execute_prepared)
+        # общее число строк считается оконной функцией в том же запросе — один round-trip на страницу;
+        # без неё MySQL может остановиться на LIMIT, не досчитывая все совпадения
+        total_sql = _TOTAL_SQL if include_total else ""
+        outer_total_sql = ", pk.total_cnt" if include_total else ""
 
+        # отложенный JOIN: внутренний подзапрос сортирует и пропускает offset строк только по узким
+        # колонкам (film_id, title), а широкие (description) читаются лишь для строк страницы
         if genre:
-            count_query = """
-                SELECT COUNT(*) AS cnt
-                FROM film f
-                JOIN film_category fc ON fc.film_id = f.film_id
-                JOIN category c ON c.category_id = fc.category_id
-                WHERE c.name = %s AND f.release_year BETWEEN %s AND %s
-            """
-            cur.execute(count_query, (genre, yf, yt))
-            cnt_row = cur.fetchone()
-            total = int(cnt_row.get("cnt", 0) if cnt_row else 0)
-
-            data_query = """
-                SELECT f.title, f.release_year, f.rating, f.description, c.name AS category_name
-                FROM film f
-                JOIN film_category fc ON fc.film_id = f.film_id
-                JOIN category c ON c.category_id = fc.category_id
-                WHERE c.name = %s AND f.release_year BETWEEN %s AND %s
-                ORDER BY f.title
-                LIMIT %s OFFSET %s
+            data_query = f"""
+                SELECT f.title, f.release_year, f.rating, f.description, c.name AS genre{outer_total_sql}
+                FROM (
+                    SELECT f.film_id, f.title, fc.category_id{total_sql}
+                    FROM film f
+                    JOIN film_category fc ON fc.film_id = f.film_id
+                    JOIN category c ON c.category_id = fc.category_id
+                    WHERE c.name = %s AND f.release_year BETWEEN %s AND %s
+                    ORDER BY f.title, f.film_id
+                    LIMIT %s OFFSET %s
+                ) pk
+                JOIN film f ON f.film_id = pk.film_id
+                JOIN category c ON c.category_id = pk.category_id
+                ORDER BY pk.title, pk.film_id
             """
-            cur.execute(data_query, (genre, yf, yt, int(limit) + 1, int(offset)))
-            rows = cur.fetchall()
+            cur = _execute_prepared(conn, data_query, (genre, yf, yt, int(limit) + 1, int(offset)))
+            rows = _fetch_page(conn, cur, limit)
             results_rows = rows[:int(limit)]
         else:
             # поиск по всему каталогу (без фильтра жанра)
-            count_query = "SELECT COUNT(*) AS cnt FROM film WHERE release_year BETWEEN %s AND %s"
-            cur.execute(count_query, (yf, yt))
-            cnt_row = cur.fetchone()
-            total = int(cnt_row.get("cnt", 0) if cnt_row else 0)
-
-            data_query = """
-                SELECT f.title, f.release_year, f.rating, f.description, NULL AS category_name
-                FROM film f
-                WHERE f.release_year BETWEEN %s AND %s
-                ORDER BY f.title
-                LIMIT %s OFFSET %s
+            data_query = f"""
+                SELECT f.title, f.release_year, f.rating, f.description, NULL AS genre{outer_total_sql}
+                FROM (
+                    SELECT f.film_id, f.title{total_sql}
+                    FROM film f
+                    WHERE f.release_year BETWEEN %s AND %s
+                    ORDER BY f.title, f.film_id
+                    LIMIT %s OFFSET %s
+                ) pk
+                JOIN film f ON f.film_id = pk.film_id
+                ORDER BY pk.title, pk.film_id
             """
-            cur.execute(data_query, (yf, yt, int(limit) + 1, int(offset)))
-            rows = cur.fetchall()
+            cur = _execute_prepared(conn, data_query, (yf, yt, int(limit) + 1, int(offset)))
+            rows = _fetch_page(conn, cur, limit)
             results_rows = rows[:int(limit)]
 
-        results: List[Dict[str, Any]] = []
-        for r in results_rows:
-            # r is a dict because of dictionary=True
-            results.append({
-                "title": r.get("title"),
-                "release_year": r.get("release_year"),
-                "rating": r.get("rating"),
-                "description": r.get("description"),
-                "genre": r.get("category_name"),  # may be None when searching all genres
-            })
-
-        has_next = (offset + len(results)) < total
+        total = _extract_total(rows, include_total, from_start=int(offset) == 0)
+        # строки dictionary-курсора уже имеют нужные ключи (genre is None при поиске по всем жанрам)
+        results: List[Dict[str, Any]] = results_rows
+
+        has_next = len(rows) > int(limit)
+        ok = True
         return {"results": results, "total_count": total, "has_next": has_next}
     finally:
-        try:
-            cur.close()
-        except Exception:
-            pass
+        _release_cursor(conn, data_query, cur, ok)
         conn.close()
 
 
+@_search_cached
 def search_by_keyword(q: str, limit: int = 10, offset: int = 0,
-                      year_from: Optional[int] = None, year_to: Optional[int] = None) -> Dict[str, Any]:
+                      year_from: Optional[int] = None, year_to: Optional[int] = None,
+                      include_total: bool = True, after: Optional[Tuple[str, int]] = None) -> Dict[str, Any]:
     """
-    Поиск по части названия (title) и по описанию (description).
+    Поиск по словам в названии (title) и описании (description): через FULLTEXT-индекс,
+    а для коротких слов — по подстроке (LIKE).
     Опционально применяет фильтр по годам (inclusive) если year_from/year_to заданы (не None).
-    Всегда возвращает словарь с keys: results, total_count, has_next.
+    Если include_total=False — общее число не считается и total_count=None.
+    Если задан after=(title, film_id) последней строки предыдущей страницы — страница читается
+    keyset-пагинацией (строки строго после after в порядке title, film_id), offset игнорируется.
+    Всегда возвращает словарь с keys: results, total_count, has_next, next_after
+    (ключ для следующей страницы или None).
     """
-    like = f"%{q}%"
-    conn = _get_conn()
+    global _fulltext_available
+    fulltext = FULLTEXT_SEARCH and _fulltext_available
     try:
-        cur = conn.cursor(dictionary=True)
+        return _search_keyword_page(q, limit, offset, year_from, year_to, include_total, after, fulltext)
+    except errors.DatabaseError as e:
+        if not fulltext or e.errno != ER_FT_MATCHING_KEY_NOT_FOUND:
+            raise
+        logger.warning("FULLTEXT index on film(title, description) is missing, falling back to LIKE "
+                       "(apply sql/001_film_fulltext.sql or set FULLTEXT_SEARCH = False)")
+        _fulltext_available = False
+        return _search_keyword_page(q, limit, offset, year_from, year_to, include_total, after, False)
 
-        where_clauses = ["(f.title LIKE %s OR f.description LIKE %s)"]
-        params: List[Any] = [like, like]
+
+def _search_keyword_page(q: str, limit: int, offset: int, year_from: Optional[int], year_to: Optional[int],
+                         include_total: bool, after: Optional[Tuple[str, int]], fulltext: bool) -> Dict[str, Any]:
+    keyword_sql, keyword_params = _keyword_clause(q, fulltext)
+    params = list(keyword_params)
+    conn = _get_conn()
+    cur = None
+    data_sql = ""
+    ok = False
+    try:
+        where_clauses = [keyword_sql]
 
         if year_from is not None and year_to is not None:
             yf = int(year_from)
@@ -161,44 +490,45 @@ def search_by_keyword(q: str, limit: int = 10, offset: int = 0,
             where_clauses.append("f.release_year <= %s")
             params.append(yt)
 
-        where_sql = " AND ".join(where_clauses)
+        # строки после ключа ищутся по индексу (title, film_id) без пропуска offset строк;
+        # COUNT(*) OVER () с after считает только оставшиеся строки, поэтому total берут с первой страницы
+        if after is not None:
+            where_clauses.append("(f.title > %s OR (f.title = %s AND f.film_id > %s))")
+            params.extend([after[0], after[0], int(after[1])])
 
-        count_sql = f"SELECT COUNT(*) AS cnt FROM film f WHERE {where_sql}"
-        cur.execute(count_sql, tuple(params))
-        cnt_row = cur.fetchone()
-        total = int(cnt_row.get("cnt", 0) if cnt_row else 0)
+        where_sql = " AND ".join(where_clauses)
 
+        # для каждого фильма берётся один представительный жанр (минимальный category_id),
+        # поэтому JOIN не размножает строки и GROUP BY не нужен; COUNT(*) OVER () считает фильмы
+        total_sql = _TOTAL_SQL if include_total else ""
         data_sql = f"""
-            SELECT f.title, f.release_year, f.rating, f.description,
-                   c.name AS category_name
+            SELECT f.film_id, f.title, f.release_year, f.rating, f.description,
+                   c.name AS genre{total_sql}
             FROM film f
-            LEFT JOIN film_category fc ON fc.film_id = f.film_id
-            LEFT JOIN category c ON c.category_id = fc.category_id
+            LEFT JOIN (
+                SELECT film_id, MIN(category_id) AS cid FROM film_category GROUP BY film_id
+            ) fc ON fc.film_id = f.film_id
+            LEFT JOIN category c ON c.category_id = fc.cid
             WHERE {where_sql}
-            GROUP BY f.film_id
-            ORDER BY f.title
+            ORDER BY f.title, f.film_id
             LIMIT %s OFFSET %s
         """
-        params_for_data = params + [int(limit) + 1, int(offset)]
-        cur.execute(data_sql, tuple(params_for_data))
-        rows = cur.fetchall()
+        params_for_data = params + [int(limit) + 1, 0 if after is not None else int(offset)]
+        # самый частый тяжёлый запрос — через prepared statement, шаблон SQL одинаков для всех страниц
+        cur = _execute_prepared(conn, data_sql, tuple(params_for_data))
+        rows = _fetch_page(conn, cur, limit)
         results_rows = rows[:int(limit)]
+        total = _extract_total(rows, include_total, from_start=(after is None and int(offset) == 0))
+        # строки dictionary-курсора уже имеют нужные ключи, пересобирать их не нужно
+        results: List[Dict[str, Any]] = results_rows
 
-        results: List[Dict[str, Any]] = []
-        for r in results_rows:
-            results.append({
-                "title": r.get("title"),
-                "release_year": r.get("release_year"),
-                "rating": r.get("rating"),
-                "description": r.get("description"),
-                "genre": r.get("category_name"),
-            })
-
-        has_next = (offset + len(results)) < total
-        return {"results": results, "total_count": total, "has_next": has_next}
+        has_next = len(rows) > int(limit)
+        next_after = None
+        if has_next and results:
+            last = results[-1]
+            next_after = (last["title"], int(last["film_id"]))
+        ok = True
+        return {"results": results, "total_count": total, "has_next": has_next, "next_after": next_after}
     finally:
-        try:
-            cur.close()
-        except Exception:
-            pass
-        conn.close()
\ No newline at end of file
+        _release_cursor(conn, data_sql, cur, ok)
+        conn.close()
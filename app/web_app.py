@@ -1,12 +1,24 @@
+import base64
+import binascii
+import functools
+import hashlib
+import hmac
+import json
+import logging
 import os
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from flask import Flask, render_template, request, redirect, url_for, flash
+from typing import Optional, Tuple
+import jinja2
+from flask import Flask, render_template, request, redirect, url_for, flash, g, make_response, abort
+from markupsafe import Markup, escape
 
 import local_settings as settings
 import mysql_connector as db
 import log_writer
 import log_stats
+import formatter
 
 
 
@@ -22,10 +34,167 @@ app = Flask(
 )
 
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev")
+# Статика отдаётся с долгим Cache-Control; актуальность обеспечивает параметр ?v=<mtime> в url_for
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = getattr(settings, "STATIC_MAX_AGE", 31536000)
+
+DEBUG = os.environ.get("FLASK_DEBUG") == "1"
+# Вне отладки шаблоны не проверяются на изменение при каждом render_template,
+# а скомпилированный байткод шаблонов переживает перезапуск воркеров (каталог JINJA_CACHE_DIR,
+# по умолчанию — во временном каталоге пользователя). Настройку нужно задать до создания jinja_env.
+app.config["TEMPLATES_AUTO_RELOAD"] = DEBUG
+app.jinja_env.bytecode_cache = jinja2.FileSystemBytecodeCache(getattr(settings, "JINJA_CACHE_DIR", None))
 
 
 
 PAGE_SIZE = getattr(settings, "PAGE_SIZE", 20)
+# Самый глубокий OFFSET, который допускаем из URL: MySQL читает и отбрасывает все пропущенные строки
+MAX_OFFSET = getattr(settings, "MAX_OFFSET", 10000)
+STATS_MAX_AGE = getattr(settings, "STATS_MAX_AGE", 60)  # секунды, Cache-Control для /stats
+# Главная без параметров одинакова для всех посетителей — готовый HTML держим в памяти INDEX_CACHE_TTL секунд
+INDEX_CACHE_TTL = getattr(settings, "INDEX_CACHE_TTL", 60)
+_index_html: Optional[Tuple[float, str]] = None  # (истекает, html)
+
+app.add_template_filter(formatter.format_timestamp, "timestamp")
+
+
+def _static_version(filename: str) -> Optional[int]:
+    # mtime читается на каждую ссылку (один stat): после правки файла URL меняется без перезапуска
+    try:
+        return int((STATIC_DIR / filename).stat().st_mtime)
+    except OSError:
+        return None
+
+
+@app.url_defaults
+def _add_static_version(endpoint, values):
+    """
+    Добавляет к ссылкам на статику версию файла (mtime), чтобы долгий кэш браузера
+    сбрасывался при изменении файла.
+    """
+    if endpoint == "static" and "filename" in values:
+        version = _static_version(values["filename"])
+        if version is not None:
+            values.setdefault("v", version)
+
+
+def _get_reference():
+    """
+    Справочные данные (жанры, min/max год) для текущего запроса.
+    Между запросами их кэширует mysql_connector (TTL), а внутри одного запроса
+    обработчик и context processor получают один и тот же результат из flask.g,
+    даже если обращение к БД не удалось — повторной попытки в том же запросе нет.
+    """
+    if "reference" not in g:
+        try:
+            g.reference = db.get_reference()
+        except Exception as e:
+            g.reference = e
+    if isinstance(g.reference, Exception):
+        raise g.reference
+    return g.reference
+
+
+def _parse_pos_int(raw: Optional[str], default: Optional[int]) -> Optional[int]:
+    """
+    Разбирает неотрицательное целое из параметра запроса без исключений.
+    Для пустого значения, для не-числа и для числа длиннее 9 цифр возвращает default
+    (огромные значения из URL не превращаются в гигантский OFFSET).
+    """
+    raw = (raw or "").strip()
+    return int(raw) if raw.isdecimal() and len(raw) <= 9 else default
+
+
+# rating и genre повторяются у множества фильмов (несколько рейтингов, полтора десятка жанров):
+# экранированная строка строится один раз на значение, а для Markup автоэкранирование Jinja — no-op
+_PRE_ESCAPED_FIELDS = ("rating", "genre")
+
+
+@functools.lru_cache(maxsize=256)
+def _pre_escaped(value: str) -> Markup:
+    return escape(value)
+
+
+def _pre_escape_rows(rows):
+    """
+    Заменяет в строках результатов значения rating и genre на заранее экранированные Markup.
+    Строки меняются на месте — повторный вызов для них из кэша поиска ничего не делает.
+    """
+    for r in rows:
+        for key in _PRE_ESCAPED_FIELDS:
+            value = r.get(key)
+            if isinstance(value, str) and not isinstance(value, Markup):
+                r[key] = _pre_escaped(value)
+    return rows
+
+
+def _sign_total(total: Optional[int], *key) -> Optional[str]:
+    """
+    Упаковывает общее число найденных для ссылок пагинации в вид "<total>.<подпись>".
+    Подпись (HMAC на SECRET_KEY) привязана к параметрам поиска key: подделанное или
+    перенесённое из другого поиска значение не пройдёт _verify_total.
+    """
+    if total is None:
+        return None
+    msg = json.dumps([total, *key], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    mac = hmac.new(str(app.config["SECRET_KEY"]).encode("utf-8"), msg, hashlib.sha256).hexdigest()[:16]
+    return f"{total}.{mac}"
+
+
+def _verify_total(raw: Optional[str], *key) -> Optional[int]:
+    """
+    Разбирает total из URL. Возвращает None для пустого, испорченного значения
+    и значения с неверной подписью — тогда общее число пересчитывается запросом.
+    """
+    raw = (raw or "").strip()
+    total = _parse_pos_int(raw.partition(".")[0], None)
+    if total is None:
+        return None
+    if not hmac.compare_digest(raw.encode("utf-8"), _sign_total(total, *key).encode("utf-8")):
+        return None
+    return total
+
+
+def _resolve_total(data: dict, total_param: Optional[int], offset: int, after_cursor: bool) -> Optional[int]:
+    """
+    Общее число найденных для страницы: посчитанное в запросе (по cursor оконная функция видит
+    только строки после него — к ним прибавляется offset), иначе проверенное значение из URL.
+    На непустой последней странице (или пустой первой) total известен точно: offset + строк на ней.
+    Для пустой страницы за концом выборки — значение из URL или None (заголовок не показывается).
+    """
+    results = data.get("results", [])
+    if not data.get("has_next", False) and (results or offset == 0):
+        return offset + len(results)
+    total = data.get("total_count")
+    if total is not None:
+        return offset + total if after_cursor else total
+    return total_param
+
+
+def _encode_cursor(after: Optional[Tuple[str, int]]) -> Optional[str]:
+    """
+    Упаковывает ключ последней строки страницы (title, film_id) в непрозрачную строку для URL.
+    """
+    if after is None:
+        return None
+    raw = json.dumps(list(after), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(raw: Optional[str]) -> Optional[Tuple[str, int]]:
+    """
+    Разбирает cursor из URL обратно в (title, film_id).
+    Для пустого или испорченного значения возвращает None — страница читается по offset.
+    """
+    raw = (raw or "").strip()
+    if not raw:
+        return None
+    try:
+        title, film_id = json.loads(base64.urlsafe_b64decode(raw + "=" * (-len(raw) % 4)))
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if not isinstance(title, str) or not isinstance(film_id, int):
+        return None
+    return title, film_id
 
 
 @app.context_processor
@@ -36,14 +205,11 @@ def inject_common():
     При ошибке возвращаем безопасные значения.
     """
     try:
-        genres = db.get_all_genres()
-        min_year, max_year = db.get_year_range()
-        min_year = int(min_year)
-        max_year = int(max_year)
+        genres, min_year, max_year = _get_reference()
     except Exception:
         genres = []
         min_year = 1900
-        max_year = datetime.utcnow().year
+        max_year = datetime.now(timezone.utc).year
     return dict(settings=settings, genres=genres, min_year=min_year, max_year=max_year)
 
 
@@ -54,6 +220,7 @@ def index():
 
     Если пришли параметры y_from/y_to/genre (форма годов отправляет их сюда),
     перенаправляем на /search/genre с теми же параметрами, чтобы сразу показать результаты.
+    Без параметров страница не зависит от посетителя и отдаётся из кэша (INDEX_CACHE_TTL).
     """
     if request.args.get("y_from") or request.args.get("y_to") or request.args.get("genre"):
         params = {}
@@ -63,7 +230,22 @@ def index():
                 params[k] = v
         return redirect(url_for("search_genre", **params))
 
-    return render_template("index.html")
+    if request.args:
+        return render_template("index.html")
+
+    global _index_html
+    hit = _index_html
+    now = time.monotonic()
+    if hit is not None and hit[0] > now:
+        return hit[1]
+    try:
+        _get_reference()
+    except Exception:
+        # страницу с запасными жанрами/годами не кэшируем
+        return render_template("index.html")
+    html = render_template("index.html")
+    _index_html = (now + INDEX_CACHE_TTL, html)
+    return html
 
 
 @app.route("/search/keyword")
@@ -71,21 +253,29 @@ def search_keyword():
     """
     Поиск по ключевому слову.
     Защищаемся от некорректного возвращаемого значения из db.search_by_keyword.
+    Ссылка «Следующие» несёт cursor — ключ последней строки страницы, и следующая страница
+    читается keyset-пагинацией без OFFSET; без cursor (переход назад, ручной ввод page) — по offset.
     """
     q = (request.args.get("q") or "").strip()
-    page = request.args.get("page", "1")
-    try:
-        page = max(1, int(page))
-    except (ValueError, TypeError):
-        page = 1
+    page = max(1, _parse_pos_int(request.args.get("page"), 1))
+    after = _decode_cursor(request.args.get("cursor")) if page > 1 else None
+    # общее число с первой страницы приходит в ссылках пагинации (с подписью) и не пересчитывается
+    total_param = _verify_total(request.args.get("total"), "keyword", q) if page > 1 else None
 
     if not q:
         flash("Введите ключевое слово для поиска.", "warning")
         return redirect(url_for("index"))
 
     offset = (page - 1) * PAGE_SIZE
+    # по cursor страница ищется по индексу, без OFFSET, — глубина не ограничивается
+    if after is None and offset > MAX_OFFSET:
+        flash("Слишком далёкая страница, показываем первую.", "warning")
+        return redirect(url_for("search_keyword", q=q))
     try:
-        data = db.search_by_keyword(q, limit=PAGE_SIZE, offset=offset)
+        # общее число считается на первой странице (для показа и для лога)
+        # и когда total в URL нет или он не прошёл проверку
+        include_total = page == 1 or total_param is None
+        data = db.search_by_keyword(q, limit=PAGE_SIZE, offset=offset, include_total=include_total, after=after)
     except Exception as e:
         app.logger.exception("DB error in search_by_keyword")
         flash(f"Ошибка выполнения запроса: {e}", "error")
@@ -97,17 +287,20 @@ def search_keyword():
 
     if page == 1:
         try:
-            log_writer.log_query("keyword", {"keyword": q}, data.get("total_count", 0))
+            log_writer.log_query("keyword", {"keyword": q}, data.get("total_count") or 0)
         except Exception as e:
             app.logger.warning("Logging failed: %s", e)
 
+    total = _resolve_total(data, total_param, offset, after_cursor=after is not None)
     return render_template(
         "results_keyword.html",
         q=q,
-        results=data.get("results", []),
-        total=data.get("total_count", 0),
+        results=_pre_escape_rows(data.get("results", [])),
+        total=total,
+        total_token=_sign_total(total, "keyword", q),
         page=page,
         has_next=data.get("has_next", False),
+        next_cursor=_encode_cursor(data.get("next_after")),
         page_size=PAGE_SIZE,
     )
 
@@ -122,41 +315,37 @@ def search_genre():
     genre = (request.args.get("genre") or "").strip()
     raw_y_from = (request.args.get("y_from") or "").strip()
     raw_y_to = (request.args.get("y_to") or "").strip()
-    page = request.args.get("page", "1")
+    page = max(1, _parse_pos_int(request.args.get("page"), 1))
 
-    try:
-        page = max(1, int(page))
-    except (ValueError, TypeError):
-        page = 1
+    # Формат годов проверяем до обращения к БД: некорректный ввод не занимает соединение из пула
+    y_from_i = _parse_pos_int(raw_y_from, None)
+    if raw_y_from != "" and y_from_i is None:
+        flash("Год 'От' должен быть числом.", "warning")
+        return redirect(url_for("index"))
+
+    y_to_i = _parse_pos_int(raw_y_to, None)
+    if raw_y_to != "" and y_to_i is None:
+        flash("Год 'До' должен быть числом.", "warning")
+        return redirect(url_for("index"))
 
     # Получаем справочные данные
     try:
-        genres = db.get_all_genres()
-        min_year, max_year = db.get_year_range()
-        min_year = int(min_year)
-        max_year = int(max_year)
+        genres, min_year, max_year = _get_reference()
     except Exception as e:
         app.logger.exception("Error getting reference data")
         flash(f"Ошибка при получении справочной информации: {e}", "error")
         return redirect(url_for("index"))
 
     # Если жанр указан, проверяем, что он есть в списке (если список доступен)
-    if genre and genres and genre not in genres:
-        flash("Укаж��те существующий жанр из списка.", "warning")
-        return redirect(url_for("index"))
-
-    # Парсим годы: если пусто — используем min/max
-    try:
-        y_from_i = int(raw_y_from) if raw_y_from != "" else min_year
-    except ValueError:
-        flash("Год 'От' должен быть числом.", "warning")
+    if genre and genres and genre not in db.get_genre_set():
+        flash("Укажите существующий жанр из списка.", "warning")
         return redirect(url_for("index"))
 
-    try:
-        y_to_i = int(raw_y_to) if raw_y_to != "" else max_year
-    except ValueError:
-        flash("Год 'До' должен быть числом.", "warning")
-        return redirect(url_for("index"))
+    # Пустые границы — весь доступный диапазон
+    if y_from_i is None:
+        y_from_i = min_year
+    if y_to_i is None:
+        y_to_i = max_year
 
     # Кламп и нормализация диапазона
     if y_from_i < min_year:
@@ -167,11 +356,17 @@ def search_genre():
         y_from_i, y_to_i = y_to_i, y_from_i
 
     offset = (page - 1) * PAGE_SIZE
+    if offset > MAX_OFFSET:
+        flash("Слишком далёкая страница, показываем первую.", "warning")
+        return redirect(url_for("search_genre", genre=genre or None, y_from=y_from_i, y_to=y_to_i))
+    total_key = ("genre_year", genre, y_from_i, y_to_i)
+    total_param = _verify_total(request.args.get("total"), *total_key) if page > 1 else None
 
     # Вызов mysql_connector — сначала именованный, затем позиционный (fallback).
     try:
         try:
-            data = db.search_by_genre_year(genre=genre or None, year_from=y_from_i, year_to=y_to_i, limit=PAGE_SIZE, offset=offset)
+            data = db.search_by_genre_year(genre=genre or None, year_from=y_from_i, year_to=y_to_i, limit=PAGE_SIZE, offset=offset,
+                                           include_total=(page == 1 or total_param is None))
         except TypeError:
             # Попытка с позиционными аргументами: genre, year_from, year_to, limit, offset
             data = db.search_by_genre_year(genre or None, y_from_i, y_to_i, PAGE_SIZE, offset)
@@ -189,17 +384,19 @@ def search_genre():
             log_params = {"year_from": y_from_i, "year_to": y_to_i}
             if genre:
                 log_params["genre"] = genre
-            log_writer.log_query("genre_year", log_params, data.get("total_count", 0))
+            log_writer.log_query("genre_year", log_params, data.get("total_count") or 0)
         except Exception as e:
             app.logger.warning("Logging failed: %s", e)
 
+    total = _resolve_total(data, total_param, offset, after_cursor=False)
     return render_template(
         "results_genre.html",
         genre=genre,
         y_from=y_from_i,
         y_to=y_to_i,
-        results=data.get("results", []),
-        total=data.get("total_count", 0),
+        results=_pre_escape_rows(data.get("results", [])),
+        total=total,
+        total_token=_sign_total(total, *total_key),
         page=page,
         has_next=data.get("has_next", False),
         page_size=PAGE_SIZE,
@@ -210,20 +407,68 @@ def search_genre():
 def stats():
     """
     Страница статистики.
+    Ответ помечается ETag по данным страницы: если у браузера та же версия,
+    возвращаем 304 без рендеринга шаблона.
     """
+    failed = False
+    popular_future, latest_future = log_stats.submit_stats(limit=5)
+    # справочные данные (для ETag и контекста шаблона) читаются, пока агрегации MongoDB идут в фоне
     try:
-        popular = log_stats.get_top_popular(limit=5)
+        reference = _get_reference()
+    except Exception:
+        reference = None
+
+    try:
+        popular = popular_future.result()
     except Exception as e:
         popular = []
+        failed = True
         flash(f"Ошибка получения популярных запросов: {e}", "error")
 
     try:
-        latest = log_stats.get_latest_unique(limit=5)
+        latest = latest_future.result()
     except Exception as e:
         latest = []
+        failed = True
         flash(f"Ошибка получения последних запросов: {e}", "error")
 
-    return render_template("stats.html", popular=popular, latest=latest)
+    # страницу с ошибкой не кэшируем, чтобы после восстановления MongoDB браузер не держал пустые списки
+    if failed:
+        return render_template("stats.html", popular=popular, latest=latest)
+
+    etag = hashlib.md5(repr((popular, latest, reference)).encode("utf-8")).hexdigest()
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = make_response(render_template("stats.html", popular=popular, latest=latest))
+    response.set_etag(etag)
+    response.cache_control.max_age = STATS_MAX_AGE
+    response.cache_control.public = True
+    return response
+
+
+@app.route("/admin/reload", methods=["POST"])
+def admin_reload():
+    """
+    Сбрасывает кэши справочных данных, страниц поиска и главной страницы в этом процессе
+    (после обновления каталога фильмов). Требует заголовок X-Admin-Token,
+    совпадающий с ADMIN_TOKEN из настроек; без настроенного токена маршрут недоступен.
+    """
+    global _index_html
+    token = getattr(settings, "ADMIN_TOKEN", None)
+    if not token:
+        abort(404)
+    # сравниваем байты: compare_digest падает с TypeError на str с не-ASCII символами.
+    # WSGI отдаёт заголовки строкой, декодированной как latin-1, — encode("latin-1") возвращает
+    # ровно присланные байты, а токен из настроек сравнивается в UTF-8
+    sent = request.headers.get("X-Admin-Token", "").encode("latin-1", "replace")
+    if not hmac.compare_digest(sent, token.encode("utf-8")):
+        abort(403)
+    db.invalidate_reference_cache()
+    db.invalidate_search_cache()
+    _index_html = None
+    return "", 204
 
 
 @app.errorhandler(404)
@@ -235,5 +480,6 @@ def not_found(_e):
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     port = int(os.environ.get("PORT", 5050))
-    app.run(host="0.0.0.0", port=port, debug=True)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=port, debug=DEBUG)
\ No newline at end of file
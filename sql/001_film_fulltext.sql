@@ -0,0 +1,4 @@
+-- Полнотекстовый индекс для поиска по ключевому слову (app/mysql_connector.search_by_keyword).
+-- Применяется один раз к базе sakila: mysql sakila < sql/001_film_fulltext.sql
+-- Без индекса выставьте FULLTEXT_SEARCH = False в local_settings.py — поиск вернётся к LIKE.
+ALTER TABLE film ADD FULLTEXT INDEX ft_title_desc (title, description);
@@ -0,0 +1,14 @@
+"""
+WSGI-точка входа для продакшен-запуска веб-приложения, например:
+
+    gunicorn -w 4 -k gthread --threads 8 -b 0.0.0.0:5050 wsgi:app
+
+Модули app/ импортируют друг друга по короткому имени (import mysql_connector),
+поэтому каталог app добавляется в sys.path; local_settings берётся из корня проекта.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "app"))
+
+from web_app import app  # noqa: E402